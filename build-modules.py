@@ -3,72 +3,276 @@
 import argparse
 import sys
 import json, re
-import os, subprocess, shlex
-from shutil import rmtree
-from urllib.request import Request, urlopen
-from urllib.error import URLError, HTTPError
+import os, subprocess
+import netrc, time, atexit, platform, signal
+from shutil import rmtree, which, copyfileobj, copytree
+from pathlib import Path
+from datetime import datetime
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryFile, TemporaryDirectory
+from threading import Lock
 from packaging import version
 
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 
-IS_RASPI_RE = r'arm(v[6-7](l|hf))$'
-CROSS_COMPILE_ARGS = ['ARCH=arm', 'CROSS_COMPILE=arm-linux-gnueabihf-']
+IS_RASPI_RE = re.compile(r'arm(v[6-7](l|hf))$')
+TAUDAC_RE = re.compile(r'taudac-.* for ([\d\.]+)')
+KERNEL_RE = re.compile(r'kernel:? (?i:bump|update) to ([\d\.]+)')
+CROSS_COMPILE = 'arm-linux-gnueabihf-'
+CROSS_COMPILE_ARGS = ['ARCH=arm', f'CROSS_COMPILE={CROSS_COMPILE}']
+RASPI_VARIANTS = ['', '-v7', '-v7l']
+GIT_CMD = ['git', '-C', '../modules/']
+
+_log_lock = Lock()
+_background = set()
+_smtp_server = None
+
+# share one keep-alive connection pool between all GitHub API requests
+_session = requests.Session()
+_session.headers['Accept'] = 'application/vnd.github+json'
+_session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=4,
+        max_retries=Retry(total=3, backoff_factor=0.3,
+                respect_retry_after_header=False)))
+
+# GitHub responses are cached on disk and revalidated with their ETag
+_cache = {}
+_cache_used = set()
+
+# requests to keep in hand before throttling towards the rate limit reset
+RATE_LIMIT_RESERVE = 10
 
 
 class GitHubRepo:
-    def __init__(self, user, project, token=None):
+    PER_PAGE = 100
+
+    def __init__(self, user, project, token=None, since=None):
         self.GITHUB_API_URL = 'https://api.github.com/repos'
         self.user = user
         self.project = project
+        self.since = since
+        self._prefetched = None
         if token is None:
-            self.token = os.getenv('GITHUB_TOKEN')
-            if self.token is None:
-                print(f"Warning: {user}@{project}: GITHUB_TOKEN environment variable not set.")
-            else:
+            if os.getenv('GITHUB_TOKENS'):
+                token = os.getenv('GITHUB_TOKENS')
+                print(f"Info: {user}@{project}: Using GITHUB_TOKENS environment variable.")
+            elif os.getenv('GITHUB_TOKEN') is not None:
+                token = os.getenv('GITHUB_TOKEN')
                 print(f"Info: {user}@{project}: Using GITHUB_TOKEN environment variable.")
+            else:
+                token = netrc_token('api.github.com')
+                if token is None:
+                    print(f"Warning: {user}@{project}: GITHUB_TOKEN environment variable not set.")
+                else:
+                    print(f"Info: {user}@{project}: Using token from ~/.netrc.")
         else:
-            self.token = token
             print(f"Info: {user}@{project}: Using provided token.")
+        # several comma separated tokens are used round-robin
+        self.tokens = [t for t in (token or '').split(',') if t] or [None]
+        self._token_idx = 0
+        self._token_reset = {}
+        self._token_low = {}
 
     def __iter__(self):
-        self.n = 0
+        self._buf = []
+        self._page = 1
+        if self._prefetched is not None:
+            self._buf = self._prefetched.result()
+            self._page = 2 if self._has_next else None
+            self._prefetched = None
         return self
 
     def __next__(self):
-        ret = self.log(max_count=1, revision=f"HEAD~{self.n}")
-        if ret is not None:
-            self.n += 1
-            return ret[0]
-        else:
+        if not self._buf:
+            # the previous page was the last one, don't ask for an empty page
+            if self._page is None:
+                raise StopIteration
+            self._buf = self.log(max_count=self.PER_PAGE, page=self._page,
+                    since=self.since)
+            self._page = self._page + 1 if self._has_next else None
+        if not self._buf:
             raise StopIteration
+        return self._buf.pop(0)
+
+    def prefetch(self, executor):
+        # fetch the first page in the background, picked up by __iter__()
+        self._prefetched = executor.submit(self.log,
+                max_count=self.PER_PAGE, since=self.since)
+
+    def log(self, max_count=10, revision="HEAD", page=1, since=None):
+        url = f"{self.GITHUB_API_URL}/{self.user}/{self.project}/commits?per_page={max_count}&sha={revision}&page={page}"
+        if since is not None:
+            url += f"&since={quote(since)}"
+
+        cached = _cache.get(url)
+        waited = False
+        # try each token once, then wait once for a reset and try again
+        tries = len(self.tokens)
+        while True:
+            token = self._next_token()
+            tries -= 1
+            try:
+                headers = {}
+                if token:
+                    headers['Authorization'] = f"Bearer {token}"
+                if cached is not None:
+                    headers['If-None-Match'] = cached['etag']
+                r = _session.get(url, headers=headers, timeout=10)
+                r.raise_for_status()
+                break
+            except requests.HTTPError as e:
+                if self._rate_limited(e.response, token):
+                    # retry with the next token, or wait once for a reset
+                    if tries > 0 and self._next_token_available():
+                        continue
+                    if not waited:
+                        self._wait_for_reset()
+                        waited = True
+                        tries = 1
+                        continue
+                elif 'Retry-After' in e.response.headers and not waited:
+                    # secondary rate limit, GitHub tells how long to back off
+                    time.sleep(max(1, int(e.response.headers['Retry-After'])))
+                    waited = True
+                    tries = 1
+                    continue
+                if e.response.status_code in (403, 429):
+                    print(f"HTTP Error {e.response.status_code}: Rate limit exceeded.\n"
+                          "Consider setting the GITHUB_TOKEN environment "
+                          "variable or passing --github-token to increase "
+                          "your rate limit.")
+                sys.exit(1)
+            except requests.RequestException as e:
+                print(e)
+                raise
+        self._throttle(r, token)
+
+        # not modified, only free against the rate limit if authorized
+        if r.status_code == 304:
+            _cache_used.add(url)
+            self._has_next = cached['has_next']
+            return [tuple(m) for m in cached['messages']]
+
+        messages = [(c['sha'][0:8], c['commit']['message'].split('\n', 1)[0])
+                for c in json_loads(r.content)]
+        self._has_next = 'next' in r.links
+
+        if 'ETag' in r.headers:
+            _cache[url] = {'etag': r.headers['ETag'],
+                    'has_next': self._has_next, 'messages': list(messages)}
+            _cache_used.add(url)
+        return messages
+
+    def _next_token(self):
+        for _ in range(len(self.tokens)):
+            token = self.tokens[self._token_idx % len(self.tokens)]
+            self._token_idx += 1
+            if self._token_reset.get(token, 0) <= time.time():
+                return token
+        return token
+
+    def _next_token_available(self):
+        return any(self._token_reset.get(t, 0) <= time.time() for t in self.tokens)
+
+    def _rate_limited(self, r, token):
+        if r.status_code not in (403, 429) or r.headers.get('X-RateLimit-Remaining') != '0':
+            return False
+        # don't reuse the token right away, even if the reset time is already
+        # due by the local clock or missing
+        reset = int(r.headers.get('X-RateLimit-Reset', 0))
+        self._token_reset[token] = max(reset, time.time() + 1)
+        return True
+
+    def _throttle(self, r, token):
+        # spread the last requests of nearly drained tokens until their reset
+        remaining = int(r.headers.get('X-RateLimit-Remaining', RATE_LIMIT_RESERVE))
+        if remaining >= RATE_LIMIT_RESERVE:
+            self._token_low.pop(token, None)
+            return
+        self._token_low[token] = int(r.headers.get('X-RateLimit-Reset', 0))
+        if len(self._token_low) == len(self.tokens):
+            time.sleep(max(0, self._token_low[token] - time.time()) / max(1, remaining))
 
-    def log(self, max_count=10, revision="HEAD"):
+    def _wait_for_reset(self):
+        wait = max(0, min(self._token_reset.values()) - time.time()) + 1
+        print(f"Info: {self.user}@{self.project}: Rate limit exceeded, "
+              f"waiting {wait:.0f} s for it to reset...")
+        time.sleep(wait)
+
+
+def cache_file():
+    # Path.home() raises RuntimeError if there is no home directory
+    return Path.home() / '.cache' / 'taudac-build' / 'github.json'
+
+
+def load_cache():
+    try:
+        _cache.update(json.loads(cache_file().read_text()))
+    except (OSError, RuntimeError, ValueError):
+        pass
+
+
+def save_cache():
+    try:
+        file = cache_file()
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix('.tmp')
+        # only keep the responses this run has asked for
+        tmp.write_text(json.dumps({url: _cache[url] for url in _cache_used}))
+        tmp.replace(file)
+    except (OSError, RuntimeError) as e:
+        print(f"Warning: Failed writing cache: {e}")
+
+
+def netrc_token(host):
+    try:
+        auth = netrc.netrc().authenticators(host)
+    except (OSError, netrc.NetrcParseError):
+        return None
+    return auth[2] if auth is not None else None
+
+
+def smtp():
+    global _smtp_server
+    # builds take a while, the server may have dropped the idle connection
+    if _smtp_server is not None:
         try:
-            url = f"{self.GITHUB_API_URL}/{self.user}/{self.project}/commits?per_page={max_count}&sha={revision}"
-            request = Request(url)
-            if self.token:
-                request.add_header("Authorization", f"token {self.token}")
-            json_str = urlopen(request).read()
-            commits = json.loads(json_str.decode('utf-8'))
-        except HTTPError as e:
-            if e.code == 403:
-                print("HTTP Error 403: Rate limit exceeded.\n"
-                      "Consider setting the GITHUB_TOKEN environment "
-                      "variable to increase your rate limit.")
-            sys.exit(1)
-        except URLError as e:
-            print(e)
-            raise
+            if _smtp_server.noop()[0] == 250:
+                return _smtp_server
+        except (smtplib.SMTPException, OSError):
+            pass
+        _smtp_server.close()
 
-        messages = []
-        for c in commits:
-            messages.append(
-                    (c['sha'][0:8], c['commit']['message'].split('\n')[0]))
-        return messages
+    _smtp_server = None
+    server = smtplib.SMTP(args.smtp_server, args.smtp_server_port)
+    try:
+        server.starttls()
+        server.login(args.smtp_user, args.smtp_pass)
+    except Exception:
+        server.close()
+        raise
+    _smtp_server = server
+    return server
+
+
+def smtp_quit():
+    if _smtp_server is not None:
+        try:
+            _smtp_server.quit()
+        except (smtplib.SMTPException, OSError):
+            _smtp_server.close()
 
 
 def send_email(subject='', body='', filename=None):
@@ -88,11 +292,7 @@ def send_email(subject='', body='', filename=None):
         msg.attach(part)
 
     print("Sending email...")
-    server = smtplib.SMTP(args.smtp_server, args.smtp_server_port)
-    server.starttls()
-    server.login(args.smtp_user, args.smtp_pass)
-    server.send_message(msg)
-    server.quit()
+    smtp().send_message(msg)
 
 
 def query_yes_no(question):
@@ -114,12 +314,101 @@ def query_yes_no(question):
 
 
 def call(cmd, **kwargs):
-    if not isinstance(cmd, list):
-        cmd = shlex.split(cmd)
-    if args.log_file is not None:
-        with open(args.log_file, 'a+') as file:
-            subprocess.check_call(cmd, stdout=file, stderr=file, **kwargs)
-    subprocess.check_call(cmd, **kwargs)
+    if args.log_fp is None:
+        check_call(cmd, **kwargs)
+        return
+    # buffer the output, so that concurrent commands don't interleave in the log
+    with TemporaryFile() as output:
+        try:
+            check_call(cmd, stdout=output, stderr=output, **kwargs)
+        finally:
+            output.seek(0)
+            with _log_lock:
+                copyfileobj(output, args.log_fp)
+
+
+def check_call(cmd, timeout=None, **kwargs):
+    # like subprocess.check_call(), but keeps track of background commands
+    with subprocess.Popen(cmd, **kwargs) as p:
+        if kwargs.get('start_new_session'):
+            _background.add(p)
+        try:
+            retcode = p.wait(timeout=timeout)
+        except BaseException:
+            p.kill()
+            raise
+        finally:
+            _background.discard(p)
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, cmd)
+
+
+def kill_background():
+    for p in list(_background):
+        try:
+            os.killpg(p.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def get_sources(sha, background=False):
+    gks_args = ['./get-rpi-kernel-sources.sh', sha]
+    if args.directory is not None:
+        gks_args.insert(1, f"-d{args.directory}")
+    if args.working_directory is not None:
+        gks_args.insert(1, f"-w{args.working_directory}")
+    # in its own session, so that the whole process group can be killed
+    call(gks_args, start_new_session=background)
+
+
+def build(kver, cross_compile_args):
+    if not args.parallel:
+        build_in('../taudac-driver-dkms/src/', kver, cross_compile_args)
+        return
+    # kbuild writes its objects into the source directory, give each
+    # concurrent build its own copy, next to the original one so that
+    # relative paths in the Makefile still resolve
+    with TemporaryDirectory(dir='../taudac-driver-dkms/', prefix='.src-') as src:
+        copytree('../taudac-driver-dkms/src/', src, symlinks=True,
+                dirs_exist_ok=True)
+        # in its own session, so that a failing variant can stop the others
+        build_in(src, kver, cross_compile_args, start_new_session=True)
+
+
+def build_parallel(kver, cross_compile_args):
+    ex = ThreadPoolExecutor(len(RASPI_VARIANTS))
+    try:
+        builds = [ex.submit(build, kver + pver, cross_compile_args)
+                for pver in RASPI_VARIANTS]
+        for b in builds:
+            b.result()
+    except BaseException:
+        # stop at the first failure, like the serial build does
+        ex.shutdown(wait=False, cancel_futures=True)
+        kill_background()
+        raise
+    ex.shutdown()
+
+
+def build_in(src, kver, cross_compile_args, **kwargs):
+    make_args = ['make', '--no-print-directory', '--always-make',
+            '-C', src,
+            'INSTALL_TO_ORIGDIR=1', *cross_compile_args, *args.extra_make_args,
+            f'kernelver={kver}+',
+            f'prefix={args.directory}', 'release']
+    # reuse object files across variants and kernel versions
+    if args.ccache:
+        cc = f"{CROSS_COMPILE if cross_compile_args else ''}gcc"
+        make_args.insert(-1, f'CC=ccache {cc}')
+    # leave the job count to an outer make's jobserver, if there is one,
+    # concurrent variant builds share the jobs between them
+    makeflags = os.environ.get('MAKEFLAGS', '')
+    if '-j' not in makeflags and 'jobserver' not in makeflags:
+        jobs = args.jobs
+        if args.parallel:
+            jobs = max(1, jobs // len(RASPI_VARIANTS))
+        make_args.insert(1, f'-j{jobs}')
+    call(make_args, **kwargs)
 
 
 def notify_done(kver):
@@ -141,41 +430,49 @@ def notify_except(note):
 
 
 def main(cross_compile_args=""):
-    firmware = GitHubRepo("raspberrypi", "firmware")
-    taudac = GitHubRepo("taudac", "modules")
-    git_cmd = ['git', '-C', '../modules/']
+    firmware = GitHubRepo("raspberrypi", "firmware", args.github_token,
+            since=args.since)
+    taudac = GitHubRepo("taudac", "modules", args.github_token)
 
-    # get latest supported kernel version
-    if args.current_version is not None:
-        ckver = args.current_version
-    else:
-        last_commits = taudac.log(2)
-        if last_commits is None:
-            print("Failed reading taudac log!")
-            return
-        for commit in last_commits:
-            m = re.match(r'taudac-.* for ([\d\.]+)', commit[1])
-            if m:
-                ckver = m.group(1)
-                break
+    # look up the current version while the firmware log is being fetched
+    with ThreadPoolExecutor(1) as ex:
+        firmware.prefetch(ex)
+
+        # get latest supported kernel version
+        if args.current_version is not None:
+            ckver = args.current_version
         else:
-            print("Didn't find supported kernel version!")
-            return
+            last_commits = taudac.log(2)
+            if last_commits is None:
+                print("Failed reading taudac log!")
+                return
+            for commit in last_commits:
+                m = TAUDAC_RE.match(commit[1])
+                if m:
+                    ckver = m.group(1)
+                    break
+            else:
+                print("Didn't find supported kernel version!")
+                return
 
     print(f"Latest supported kernel is {ckver}")
 
     # check if newer kernels are available
     pending = []
+    seen = set()
+    ckver_v = version.parse(ckver)
     for c in firmware:
-        m = re.match(r'kernel:? ([Bb]ump|[Uu]pdate) to ([\d\.]+)', c[1])
+        m = KERNEL_RE.match(c[1])
         if m is not None:
-            nkver = m.group(2)
-            if version.parse(nkver) <= version.parse(ckver):
+            nkver = m.group(1)
+            nkver_v = version.parse(nkver)
+            if nkver_v <= ckver_v:
                 break
-            if nkver in [v[1] for v in pending]:
+            if nkver in seen:
                 print(f"WARNING: Skipping {nkver}, already in pending list.")
                 continue
-            pending.append((c[0], nkver))
+            seen.add(nkver)
+            pending.append((c[0], nkver, nkver_v))
             print(f"[{len(pending):02d}] New kernel available: {pending[-1][1]} ({pending[-1][0]})")
 
     if not pending:
@@ -186,48 +483,60 @@ def main(cross_compile_args=""):
         return
 
     print("Updating working directory...")
-    call(git_cmd + ['pull', '--ff-only'])
+    call(GIT_CMD + ['pull', '--ff-only'])
 
-    pending = sorted(pending, key=lambda x: version.parse(x[1]))
+    pending = sorted(pending, key=lambda x: x[2])
     if args.max_versions:
         pending = pending[:args.max_versions]
 
-    # download sources and build modules for each new kernel
-    for sha, kver in pending:
-        # download
-        gks_args = ['./get-rpi-kernel-sources.sh', sha]
-        if args.directory is not None:
-            gks_args.insert(1, f"-d{args.directory}")
-        if args.working_directory is not None:
-            gks_args.insert(1, f"-w{args.working_directory}")
-        call(gks_args)
-        # remove old modules
-        rmtree('../modules/lib', ignore_errors=True)
-        # launch make
-        for pver in ["", "-v7", "-v7l"]:
-            make_args = ['make', '--no-print-directory', '--always-make',
-                    '-C', '../taudac-driver-dkms/src/',
-                    'INSTALL_TO_ORIGDIR=1', *cross_compile_args, *args.extra_make_args,
-                    f'kernelver={kver}{pver}+',
-                    f'prefix={args.directory}', 'release']
-            call(make_args)
-        # git add new modules
-        call(git_cmd + ['add', 'lib/'])
-        # git commit
-        with open('../modules/.git/taudac_git_tag', 'r') as f:
-            msg = f.read().lstrip('#').rstrip()
-        call(git_cmd + ['commit', '-am', msg])
-        # git tag
-        if not args.do_not_tag:
-            call(git_cmd + ['tag', '--force',
-                    f'rpi-volumio-{kver}-taudac-modules'])
-        # git push
-        call(git_cmd + ['log', '--oneline', '--decorate=on', 'origin/master..'])
-        if query_yes_no("Do you want to publish?"):
-            call(git_cmd + ['push'],           timeout=30)
-            call(git_cmd + ['push', '--tags'], timeout=30)
-        # done
-        notify_done(kver)
+    # download sources and build modules for each new kernel, unless its
+    # output would mix with the prompts, the sources of the next kernel are
+    # downloaded while the current one is built
+    overlap = args.log_fp is not None or args.assume_yes
+    downloader = ThreadPoolExecutor(1)
+    try:
+        if overlap:
+            download = downloader.submit(get_sources, pending[0][0], True)
+        for i, (sha, kver, _) in enumerate(pending):
+            # download
+            if overlap:
+                download.result()
+                if i + 1 < len(pending):
+                    download = downloader.submit(get_sources,
+                            pending[i + 1][0], True)
+            else:
+                get_sources(sha)
+            # remove old modules
+            rmtree('../modules/lib', ignore_errors=True)
+            # launch make
+            if args.parallel:
+                build_parallel(kver, cross_compile_args)
+            else:
+                for pver in RASPI_VARIANTS:
+                    build(kver + pver, cross_compile_args)
+            # git add new modules
+            call(GIT_CMD + ['add', 'lib/'])
+            # git commit
+            with open('../modules/.git/taudac_git_tag', 'r') as f:
+                msg = f.read().lstrip('#').rstrip()
+            call(GIT_CMD + ['commit', '-am', msg])
+            # git tag
+            if not args.do_not_tag:
+                call(GIT_CMD + ['tag', '--force',
+                        f'rpi-volumio-{kver}-taudac-modules'])
+            # git push
+            call(GIT_CMD + ['log', '--oneline', '--decorate=on', 'origin/master..'])
+            if query_yes_no("Do you want to publish?"):
+                call(GIT_CMD + ['push'],           timeout=30)
+                call(GIT_CMD + ['push', '--tags'], timeout=30)
+            # done
+            notify_done(kver)
+    except BaseException:
+        # don't hold up the error report for a download nobody will use
+        downloader.shutdown(wait=False, cancel_futures=True)
+        kill_background()
+        raise
+    downloader.shutdown()
 
 
 def dir_path(path):
@@ -237,6 +546,14 @@ def dir_path(path):
         raise argparse.ArgumentTypeError(f"'{path}' is not a valid path")
 
 
+def iso_date(date):
+    try:
+        datetime.fromisoformat(date)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{date}' is not a valid ISO 8601 date")
+    return date
+
+
 def new_file_path(file):
     if os.path.isfile(file):
         raise argparse.ArgumentTypeError(f"'{file}' exists")
@@ -267,9 +584,26 @@ if __name__ == '__main__':
     parser.add_argument('-e', '--extra-make-args', metavar='<ARGS>',
             default='', type=str,
             help='extra arguments to pass to the build process (make)')
+    parser.add_argument('-j', '--jobs', metavar='<N>',
+            default=os.cpu_count() or 1, type=int,
+            help='run N make jobs simultaneously, defaults to the number of CPUs')
+    parser.add_argument('--no-ccache',
+            dest='ccache', action='store_false',
+            help='do not use ccache, even if it is installed')
     parser.add_argument('-n', '--do-not-tag',
             dest='do_not_tag', action='store_true',
             help='do not tag the new modules in the git repository')
+    parser.add_argument('--parallel',
+            action='store_true',
+            help='build the modules for all Raspberry Pi variants of a kernel '
+                 'concurrently, each in its own copy of the driver sources')
+    parser.add_argument('-s', '--since', metavar='<DATE>',
+            type=iso_date,
+            help='only look for new kernels in firmware commits after DATE')
+    parser.add_argument('-t', '--github-token', metavar='<TOKEN>',
+            help='authenticate GitHub API requests with TOKEN, several comma '
+                 'separated tokens are used in turn, defaults to the '
+                 'GITHUB_TOKENS or GITHUB_TOKEN environment variable or ~/.netrc')
 
     # sub command email
     subparsers = parser.add_subparsers(dest='command', metavar='<command>')
@@ -296,11 +630,25 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
     args.extra_make_args = args.extra_make_args.split()
+    if args.ccache and which('ccache') is not None:
+        try:
+            os.environ.setdefault('CCACHE_DIR', str(Path.home() / '.ccache-taudac'))
+        except RuntimeError:
+            pass
+    else:
+        args.ccache = False
+    args.log_fp = None
+    if args.log_file is not None:
+        args.log_fp = open(args.log_file, 'ab', buffering=0)
+        atexit.register(args.log_fp.close)
+
+    load_cache()
+    atexit.register(save_cache)
+    atexit.register(smtp_quit)
 
     try:
         # check if we need to cross compile
-        machine = subprocess.check_output("uname -m", shell=True)
-        if re.match(IS_RASPI_RE, machine.decode('utf-8')) is not None:
+        if IS_RASPI_RE.match(platform.machine()) is not None:
             main()
         else:
             main(CROSS_COMPILE_ARGS)